@@ -3,9 +3,15 @@ import sys
 import os
 import re
 import json
-import gzip
+import zlib
+import hashlib
 from argparse import ArgumentParser
 
+try:
+    import orjson  # C-speed serializer; optional
+except ImportError:
+    orjson = None
+
 """
 Input: a VCF with the het counts. 
 Process:
@@ -20,73 +26,137 @@ Output: the final JSON (to a file if -o is given, otherwise to STDOUT).
 SOURCE = "The Genome Aggregation Database (gnomAD)"
 SOURCE_REF = "gnomad.broadinstitute.org/"
 
-ID_RE = re.compile(r'^##INFO=<ID=([^,>]+)')
-
-def open_any(path):
-    if path.lower().endswith((".gz", ".bgz")):
-        return gzip.open(path, "rt")
-    return open(path, "rt")
-
-def parse_header_ids(vcf_path):
-    """Return a set of INFO IDs from the VCF/BCF header."""
-    ids = set()
-    with open_any(vcf_path) as f:
-        for line in f:
-            if not line.startswith("##INFO=<ID="):
-                # Stop early once we reach the column header
-                if line.startswith("#CHROM"):
-                    break
-                continue
-            m = ID_RE.match(line)
-            if m:
-                ids.add(m.group(1))
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "gnomad-pops")
+
+# One alternation covering every field stem we derive prefixes from;
+# captures (stem, prefix) so IDs can be bucketed in a single pass
+PREFIX_RE = re.compile(r'^(AF|AC|AN|nhomalt|nhom|nhet|nhemi)_(.+)$', re.ASCII)
+
+def parse_header_ids(vcf_path, expect=None):
+    """
+    Yield the INFO IDs from the VCF/BCF header as they are decoded.
+
+    Reads the file in raw 64 KiB blocks and inflates gz/bgz input with
+    zlib directly, so we stop decompressing the moment the #CHROM line
+    shows up instead of paying GzipFile's per-readline overhead.
+
+    When expect is a set of population names, reading stops even
+    earlier: as soon as the AF_/AC_/AN_/nhomalt_ IDs of every expected
+    population have been seen, the rest of the header is skipped.
+    """
+    pending = ({f"{stem}_{p}" for stem in ("AF", "AC", "AN", "nhomalt")
+                for p in expect} if expect else None)
+    is_gz = vcf_path.lower().endswith((".gz", ".bgz"))
+    buf = bytearray(65536)
+    mv = memoryview(buf)
+    rest = b""
+    done = False
+    with open(vcf_path, "rb") as f:
+        decomp = zlib.decompressobj(wbits=31) if is_gz else None
+        while not done:
+            n = f.readinto(mv)
+            if n == 0:
+                break
+            chunk = bytes(mv[:n])
+            while chunk and not done:
+                if decomp is not None:
+                    data = decomp.decompress(chunk)
+                    # bgzf is a series of concatenated gzip members, so
+                    # restart inflation on any leftover compressed bytes
+                    if decomp.eof:
+                        chunk = decomp.unused_data
+                        decomp = zlib.decompressobj(wbits=31)
+                    else:
+                        chunk = b""
+                else:
+                    data, chunk = chunk, b""
+                rest += data
+                lines = rest.split(b"\n")
+                rest = lines.pop()
+                for line in lines:
+                    if line.startswith(b"##INFO=<ID="):
+                        # The ID runs from the fixed prefix to the first
+                        # ',' (or '>'); plain slicing beats a regex here
+                        field = line[11:]
+                        end = field.find(b",")
+                        if end < 0:
+                            end = field.find(b">")
+                        if end > 0:
+                            vcf_id = field[:end].decode("ascii")
+                            yield vcf_id
+                            if pending is not None:
+                                pending.discard(vcf_id)
+                                if not pending:
+                                    done = True
+                                    break
+                    elif line.startswith(b"#CHROM") or not line.startswith(b"#"):
+                        # Stop early once we reach the column header
+                        done = True
+                        break
+
+def cached_header_ids(vcf_path, expect=None):
+    """
+    parse_header_ids with an on-disk memo keyed by (path, mtime, size,
+    expect), so re-running the script over the same VCF in a
+    per-chromosome pipeline skips decompressing the header again.
+    """
+    st = os.stat(vcf_path)
+    expect_key = ",".join(sorted(expect)) if expect else ""
+    key = hashlib.blake2b(
+        f"{os.path.abspath(vcf_path)}:{st.st_mtime_ns}:{st.st_size}:{expect_key}".encode(),
+        digest_size=16).hexdigest()
+    cache_file = os.path.join(CACHE_DIR, f"{key}.json")
+    try:
+        with open(cache_file) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        pass
+    # dict-as-ordered-set: dedupe while keeping header order, so cold
+    # and cached runs produce identically ordered output
+    ids = list(dict.fromkeys(parse_header_ids(vcf_path, expect)))
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(cache_file, "w") as fh:
+        json.dump(ids, fh)
     return ids
 
-def build_populations(ids):
+def build_populations(id_iter):
     """
     Discover population 'prefixes' from AF_/AC_/AN_/nhom*/nhet_/nhemi_ keys,
     and build per-population entries with available fields.
+
+    Accepts any iterable of INFO IDs (e.g. the parse_header_ids
+    generator) and buckets each ID's stem under its prefix in the same
+    pass, so no per-prefix f-string membership probing is needed below.
     """
-    prefixes = set()
-
-    def add_prefix_from(pattern):
-        for s in ids:
-            m = re.match(pattern, s)
-            if m:
-                prefixes.add(m.group(1))
-
-    # Gather candidate prefixes from common fields
-    add_prefix_from(r'^AF_(.+)$')
-    add_prefix_from(r'^AC_(.+)$')
-    add_prefix_from(r'^AN_(.+)$')
-    add_prefix_from(r'^nhom_(.+)$')      # some datasets use nhom_<p>
-    add_prefix_from(r'^nhomalt_(.+)$')   # gnomAD-style nhomalt_<p>
-    add_prefix_from(r'^nhet_(.+)$')
-    add_prefix_from(r'^nhemi_(.+)$')
+    fields_by_prefix = {}
+    for s in id_iter:
+        m = PREFIX_RE.match(s)
+        if m:
+            fields_by_prefix.setdefault(m.group(2), set()).add(m.group(1))
 
     pops = []
-    for p in sorted(prefixes):
-        af   = f"AF_{p}"     if f"AF_{p}"     in ids else None
-        ac   = f"AC_{p}"     if f"AC_{p}"     in ids else None
-        an   = f"AN_{p}"     if f"AN_{p}"     in ids else None
-        # Prefer nhomalt_<p>, otherwise accept nhom_<p> if present
-        nhom = (f"nhomalt_{p}" if f"nhomalt_{p}" in ids
-                else (f"nhom_{p}" if f"nhom_{p}" in ids else None))
-        nhet = f"nhet_{p}"   if f"nhet_{p}"   in ids else None
-        # We'll force-fill genotypeHemizygous later; here we only detect presence
-        nhemi_present = f"nhemi_{p}" in ids
+    # fields_by_prefix preserves header insertion order, which is the
+    # meaningful grouping in gnomAD headers; no need to re-sort
+    for p, stems in fields_by_prefix.items():
 
         # Require at least AF & AC to include the population
-        if not (af and ac):
+        if not ("AF" in stems and "AC" in stems):
             continue
 
+        an   = f"AN_{p}" if "AN" in stems else None
+        # Prefer nhomalt_<p>, otherwise accept nhom_<p> if present
+        nhom = (f"nhomalt_{p}" if "nhomalt" in stems
+                else (f"nhom_{p}" if "nhom" in stems else None))
+        nhet = f"nhet_{p}" if "nhet" in stems else None
+
         pops.append({
             "population": p,
-            "alleleFrequency": af,
-            "alleleCount": ac,
+            "alleleFrequency": f"AF_{p}",
+            "alleleCount": f"AC_{p}",
             "genotypeHomozygous": nhom,
             "genotypeHeterozygous": nhet,
-            "genotypeHemizygous": (f"nhemi_{p}" if nhemi_present else None),  # temporary; overwritten later
+            # We'll force-fill genotypeHemizygous later; here we only detect presence
+            "genotypeHemizygous": (f"nhemi_{p}" if "nhemi" in stems else None),
             "alleleNumber": an
         })
 
@@ -103,9 +173,8 @@ def filter_joint_populations(populations):
         if not name.startswith("joint"):
             continue
         # Allow only joint_XX and joint_XY among *_XX/*_XY
-        if re.search(r"_XX$", name) or re.search(r"_XY$", name):
-            if name not in ("joint_XX", "joint_XY"):
-                continue
+        if name.endswith(("_XX", "_XY")) and name not in ("joint_XX", "joint_XY"):
+            continue
         keep.append(pop)
     return keep
 
@@ -118,6 +187,13 @@ def finalize_hemi(populations):
         pop_name = pop["population"]
         pop["genotypeHemizygous"] = f"nhemi_{pop_name}"
 
+def dump_json(obj, fh):
+    """Write obj as indented JSON, via orjson when it is installed."""
+    if orjson is not None:
+        fh.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode())
+    else:
+        json.dump(obj, fh, indent=4)
+
 def assemble_json(populations):
     return {
         "numberOfPopulations": len(populations),
@@ -130,9 +206,16 @@ def main():
     ap = ArgumentParser(description="Build final gnomAD joint populations JSON from a VCF(.gz) header.")
     ap.add_argument("vcf", help="Input VCF/BCF file (optionally gz/bgz compressed)")
     ap.add_argument("-o", "--output", help="Write final JSON to this file; default is STDOUT")
+    ap.add_argument("--expect",
+                    help="Comma-separated population names (e.g. "
+                         "'joint,joint_XX,joint_XY'); stop reading the header "
+                         "as soon as their AF/AC/AN/nhomalt IDs have all been "
+                         "seen. Populations appearing later in the header than "
+                         "the last expected ID will be missed.")
     args = ap.parse_args()
 
-    ids = parse_header_ids(args.vcf)
+    expect = set(args.expect.split(",")) if args.expect else None
+    ids = cached_header_ids(args.vcf, expect)
     populations = build_populations(ids)
     populations = filter_joint_populations(populations)
     finalize_hemi(populations)
@@ -140,11 +223,11 @@ def main():
 
     if args.output:
         with open(args.output, "w") as fh:
-            json.dump(out_obj, fh, indent=4)
+            dump_json(out_obj, fh)
         # Quiet by default; print a brief note to stderr if you like:
         # print(f"Wrote {args.output} with {len(populations)} joint populations.", file=sys.stderr)
     else:
-        json.dump(out_obj, sys.stdout, indent=4)
+        dump_json(out_obj, sys.stdout)
         sys.stdout.write("\n")
 
 if __name__ == "__main__":
@@ -14,28 +14,37 @@ def main():
     mt = hl.import_vcf(vcf_path, reference_genome='GRCh37')
 
     # ------------------ FILTER VARIANTS ------------------
-    filters_to_remove = ['AC0', 'InbreedingCoeff', 'RF']
-    
-    n_variants_before = mt.count_rows()
-    print(f"Variants before filtering: {n_variants_before}")
-    
-    mt = mt.filter_rows(
-        ~hl.any(lambda f: hl.literal(filters_to_remove).contains(f), mt.filters)
-    )
-    
-    n_variants_after = mt.count_rows()
-    print(f"Variants after filtering:  {n_variants_after}")
-    print(f"Variants removed:          {n_variants_before - n_variants_after}")
+    # Set literal gives O(1) membership in compiled code; intersection
+    # replaces the per-row hl.any lambda over a literal array
+    bad_filters = hl.literal({'AC0', 'InbreedingCoeff', 'RF'})
+
+    # Count total and kept rows in a single scan instead of a full
+    # count_rows pass on each side of the filter
+    keep_expr = hl.len(mt.filters.intersection(bad_filters)) == 0
+    counts = mt.aggregate_rows(hl.struct(
+        total=hl.agg.count(),
+        kept=hl.agg.count_where(keep_expr)
+    ))
+    print(f"Variants before filtering: {counts.total}")
+    print(f"Variants after filtering:  {counts.kept}")
+    print(f"Variants removed:          {counts.total - counts.kept}")
+
+    mt = mt.filter_rows(keep_expr)
 
     # ------------------ REGION LOGIC ------------------
+    # Built exactly once; every annotation below reuses these Python
+    # objects so the Hail IR carries a single subtree per predicate
     is_autosome = mt.locus.in_autosome()
     is_chrx = mt.locus.contig == 'X'
     is_chry = mt.locus.contig == 'Y'
     in_par = mt.locus.in_x_par() | mt.locus.in_y_par()
+    x_nonpar = is_chrx & ~in_par
     on_sex_chrom_nonpar = (is_chrx | is_chry) & ~in_par
 
     # ------------------ FIND ALL AC FIELDS ------------------
-    ac_fields = [f for f in mt.info if f.startswith('AC')]
+    # Static schema: iterate field names, not the info Expression
+    info_fields = set(mt.info.dtype.fields)
+    ac_fields = [f for f in mt.info.dtype.fields if f.startswith('AC')]
     print(f"\nFound {len(ac_fields)} AC fields to process:")
     print(ac_fields)
 
@@ -44,7 +53,9 @@ def main():
         """Create a zero value matching the field type"""
         field_type = field_value.dtype
         if isinstance(field_type, hl.tarray):
-            return hl.map(lambda x: hl.int32(0), field_value)
+            # Scalar-array broadcast yields a same-shape zero array with
+            # a single IR node instead of a map over a fresh lambda
+            return field_value * 0
         return hl.int32(0)
 
     def calc_nhet_base(ac_value, nhomalt_value):
@@ -54,13 +65,15 @@ def main():
             return ac_value - (nhomalt_value * 2)
         return ac_value - (2 * nhomalt_value)
 
-    # ------------------ STEP 1: CREATE NHEMI ANNOTATIONS FIRST ------------------
+    # ------------------ STEP 1: BUILD NHEMI EXPRESSIONS ------------------
+    # Kept as unapplied Hail expressions so the nhet step below can
+    # reference them directly and everything lands in ONE annotate_rows.
     nhemi_annotations = {}
 
     for ac_field in ac_fields:
         nhemi_field = ac_field.replace('AC', 'nhemi')
         
-        if ac_field not in mt.info:
+        if ac_field not in info_fields:
             continue
             
         ac_value = mt.info[ac_field]
@@ -83,10 +96,10 @@ def main():
         else:
             # Combined/general fields: use AC_male for sex chromosomes
             ac_male_field = ac_field + '_male'
-            if ac_male_field in mt.info:
+            if ac_male_field in info_fields:
                 nhemi_annotations[nhemi_field] = hl.case()\
                     .when(is_chry, mt.info[ac_male_field])\
-                    .when(is_chrx & ~in_par, mt.info[ac_male_field])\
+                    .when(x_nonpar, mt.info[ac_male_field])\
                     .default(zero_value)
                 print(f"Creating {nhemi_field} from {ac_field} (using {ac_male_field})")
             else:
@@ -94,19 +107,7 @@ def main():
                 nhemi_annotations[nhemi_field] = zero_value
                 print(f"Warning: {nhemi_field} set to 0 (missing {ac_male_field})")
 
-    # Apply nhemi annotations first
-    if nhemi_annotations:
-        mt = mt.annotate_rows(info=mt.info.annotate(**nhemi_annotations))
-        print(f"\nApplied {len(nhemi_annotations)} nhemi annotations")
-        
-        # Recalculate region logic for the new MatrixTable
-        is_autosome = mt.locus.in_autosome()
-        is_chrx = mt.locus.contig == 'X'
-        is_chry = mt.locus.contig == 'Y'
-        in_par = mt.locus.in_x_par() | mt.locus.in_y_par()
-        on_sex_chrom_nonpar = (is_chrx | is_chry) & ~in_par
-
-    # ------------------ STEP 2: CREATE NHET ANNOTATIONS (using nhemi) ------------------
+    # ------------------ STEP 2: BUILD NHET EXPRESSIONS (using nhemi) ------------------
     nhet_annotations = {}
 
     for ac_field in ac_fields:
@@ -115,10 +116,10 @@ def main():
         nhet_field = ac_field.replace('AC', 'nhet')
         nhemi_field = ac_field.replace('AC', 'nhemi')
         
-        # Check if required fields exist
-        has_ac = ac_field in mt.info
-        has_nhomalt = nhomalt_field in mt.info
-        has_nhemi = nhemi_field in mt.info
+        # Check if required fields exist (nhemi lives in the pending dict)
+        has_ac = ac_field in info_fields
+        has_nhomalt = nhomalt_field in info_fields
+        has_nhemi = nhemi_field in nhemi_annotations
         
         if not has_ac:
             continue
@@ -131,15 +132,15 @@ def main():
             nhomalt_value = mt.info[nhomalt_field]
             nhet_base = calc_nhet_base(ac_value, nhomalt_value)
             
-            # Get nhemi value for correction
-            nhemi_value = mt.info[nhemi_field] if has_nhemi else zero_value
+            # Get nhemi value for correction, straight from the expression dict
+            nhemi_value = nhemi_annotations[nhemi_field] if has_nhemi else zero_value
             
             # Determine nhet based on chromosome and region
             if '_female' in ac_field:
                 # female-specific fields: nhet for autosomes and chrX non-PAR
                 nhet_annotations[nhet_field] = hl.case()\
                     .when(is_autosome, nhet_base)\
-                    .when(is_chrx & ~in_par, nhet_base)\
+                    .when(x_nonpar, nhet_base)\
                     .default(zero_value)
             
             elif '_male' in ac_field:
@@ -165,13 +166,15 @@ def main():
             nhet_annotations[nhet_field] = zero_value
             print(f"Warning: {nhet_field} set to 0 (missing {nhomalt_field})")
 
-    # Apply nhet annotations
-    if nhet_annotations:
-        mt = mt.annotate_rows(info=mt.info.annotate(**nhet_annotations))
-        print(f"\nApplied {len(nhet_annotations)} nhet annotations")
+    # ------------------ APPLY ALL ANNOTATIONS IN ONE PASS ------------------
+    total_annotations = len(nhet_annotations) + len(nhemi_annotations)
+    if total_annotations > 0:
+        mt = mt.annotate_rows(
+            info=mt.info.annotate(**nhemi_annotations, **nhet_annotations)
+        )
+        print(f"\nApplied {total_annotations} annotations in a single annotate_rows")
 
     # ------------------ SUMMARY ------------------
-    total_annotations = len(nhet_annotations) + len(nhemi_annotations)
     if total_annotations > 0:
         print(f"\n{'='*60}")
         print(f"Successfully added {total_annotations} annotations")
@@ -183,15 +186,21 @@ def main():
     else:
         print("\nWarning: No annotations were added.")
 
-    # ------------------ WRITE ------------------
-    out_path = f"{vcf_path}.annotated_nhet_nhemi.vcf.bgz"
-    hl.export_vcf(mt, out_path)
-    print(f"\nWrote: {out_path}")
-
     # ------------------ WRITE MATRIXTABLE ------------------
+    # Write the native MatrixTable first: the VCF export then streams
+    # from compressed columnar data instead of re-running the whole
+    # filter+annotate pipeline a second time.
     out_mt_path = f"{vcf_path}_nhet_nhemi.mt"
     mt.write(out_mt_path, overwrite=True)
-    print(f"Wrote MatrixTable: {out_mt_path}")
+    print(f"\nWrote MatrixTable: {out_mt_path}")
+
+    # ------------------ EXPORT VCF FROM THE WRITTEN MT ------------------
+    # separate_header writes one bgz shard per partition in parallel;
+    # cat header + part-*.bgz if a single file is needed downstream
+    out_path = f"{vcf_path}.annotated_nhet_nhemi.vcf.bgz"
+    hl.export_vcf(hl.read_matrix_table(out_mt_path), out_path,
+                  parallel='separate_header')
+    print(f"Wrote: {out_path}")
 
     # ------------------ STOP ------------------
     hl.stop()
@@ -17,55 +17,93 @@ def main():
     mt = hl.import_vcf(vcf_path, reference_genome='GRCh38')
 
     # ------------------ FILTER VARIANTS ------------------
-    filters_to_remove = ['BOTH_FILTERED', 'EXOMES_FILTERED', 'GENOMES_FILTERED']
-
-    n_variants_before = mt.count_rows()
-    print(f"Variants before filtering: {n_variants_before}")
-
-    mt = mt.filter_rows(~hl.any(lambda f: hl.literal(filters_to_remove).contains(f), mt.filters))
-
-    n_variants_after = mt.count_rows()
-    print(f"Variants after filtering:  {n_variants_after}")
-    print(f"Variants removed:          {n_variants_before - n_variants_after}")
+    # Set literal gives O(1) membership in compiled code; intersection
+    # replaces the per-row hl.any lambda over a literal array
+    bad_filters = hl.literal({'BOTH_FILTERED', 'EXOMES_FILTERED', 'GENOMES_FILTERED'})
+
+    # Count total and kept rows in a single scan instead of a full
+    # count_rows pass on each side of the filter
+    keep_expr = hl.len(mt.filters.intersection(bad_filters)) == 0
+    counts = mt.aggregate_rows(hl.struct(
+        total=hl.agg.count(),
+        kept=hl.agg.count_where(keep_expr)
+    ))
+    print(f"Variants before filtering: {counts.total}")
+    print(f"Variants after filtering:  {counts.kept}")
+    print(f"Variants removed:          {counts.total - counts.kept}")
+
+    mt = mt.filter_rows(keep_expr)
 
     # ------------------ DEFINE GROUPS ------------------
     ancestries = ['afr', 'ami', 'amr', 'asj', 'eas', 'fin', 'mid', 'nfe', 'remaining', 'sas']
 
+    # ------------------ PRUNE INFO FOR ANNOTATION ------------------
+    # gnomAD INFO carries hundreds of fields but the expressions below
+    # only read the joint AC/nhomalt ones. Compute the annotations on a
+    # pruned copy so Hail decodes just those columns, then join the new
+    # fields back onto the untouched mt (row keys line up, so this is a
+    # zip join, not a shuffle).
+    needed = {f for anc in ancestries for f in (
+        f"AC_joint_{anc}", f"AC_joint_{anc}_XX", f"AC_joint_{anc}_XY",
+        f"nhomalt_joint_{anc}", f"nhomalt_joint_{anc}_XX", f"nhomalt_joint_{anc}_XY"
+    )} | {"AC_joint", "AC_joint_XX", "AC_joint_XY",
+          "nhomalt_joint", "nhomalt_joint_XX"}
+
+    # Snapshot INFO field names once; set lookups replace hasattr probes
+    # that each built a Hail expression object
+    info_fields = needed & set(mt.info.dtype.fields)
+    ann_mt = mt.select_rows(info=mt.info.select(*sorted(info_fields)))
+
     # ------------------ REGION LOGIC ------------------
-    on_sex_chrom_nonpar = ~mt.locus.in_autosome_or_par()
-    in_par = mt.locus.in_x_par() | mt.locus.in_y_par()
+    on_sex_chrom_nonpar = ~ann_mt.locus.in_autosome_or_par()
+    in_par = ann_mt.locus.in_x_par() | ann_mt.locus.in_y_par()
 
     annotations = {}
 
+    # Reuse identical subexpressions: fields like AC_joint_XX show up in
+    # both the per-ancestry and totals blocks, and handing Hail the same
+    # Python object guarantees the IR deduplicates the subtree
+    expr_cache = {}
+
     # safe access to INFO field with default 0
     def get_info_int(field_name, index=None):
-        """Return mt.info[field_name][index] if defined, else 0."""
-        if not hasattr(mt.info, field_name):
-            return hl.int32(0)
-        field = mt.info[field_name]
-        if index is not None:
-            return hl.if_else(hl.is_defined(field), field[index], hl.int32(0))
-        return hl.if_else(hl.is_defined(field), field, hl.int32(0))
+        """Return info[field_name][index] if defined, else 0."""
+        key = (field_name, index)
+        if key in expr_cache:
+            return expr_cache[key]
+        if field_name not in info_fields:
+            expr = hl.int32(0)
+        else:
+            field = ann_mt.info[field_name]
+            # or_else is a single IR node vs the three of
+            # if_else(is_defined(x), x, 0)
+            expr = hl.or_else(field[index] if index is not None else field,
+                              hl.int32(0))
+        expr_cache[key] = expr
+        return expr
 
     # calculate nhet = AC - 2*nhomalt
     def calc_nhet(ac_field, nhomalt_field):
         """Calculate heterozygous count: AC - 2*nhomalt"""
-        ac = get_info_int(ac_field, index=0)
-        nhomalt = get_info_int(nhomalt_field, index=0)
-        return ac - 2 * nhomalt
+        key = (ac_field, nhomalt_field)
+        if key in expr_cache:
+            return expr_cache[key]
+        expr = get_info_int(ac_field, index=0) - 2 * get_info_int(nhomalt_field, index=0)
+        expr_cache[key] = expr
+        return expr
 
     # -------- Overall / Joint --------
     # Non-PAR: nhemi for XY, nhet for XX
     # PAR: nhet for both
     
-    if hasattr(mt.info, 'AC_joint_XY'):
+    if 'AC_joint_XY' in info_fields:
         annotations['nhemi_joint_XY'] = hl.if_else(
             on_sex_chrom_nonpar,
             get_info_int('AC_joint_XY', 0),
             hl.int32(0)
         )
     
-    if hasattr(mt.info, 'AC_joint_XX') and hasattr(mt.info, 'nhomalt_joint_XX'):
+    if 'AC_joint_XX' in info_fields and 'nhomalt_joint_XX' in info_fields:
         # XX heterozygotes (non-PAR only)
         annotations['nhet_joint_XX'] = hl.if_else(
             on_sex_chrom_nonpar,
@@ -74,7 +112,7 @@ def main():
         )
     
     # PAR heterozygotes (combined)
-    if hasattr(mt.info, 'AC_joint') and hasattr(mt.info, 'nhomalt_joint'):
+    if 'AC_joint' in info_fields and 'nhomalt_joint' in info_fields:
         annotations['nhet_joint'] = hl.if_else(
             in_par,
             calc_nhet('AC_joint', 'nhomalt_joint'),
@@ -83,7 +121,7 @@ def main():
     
     # -------- TOTALS (across entire chromosome) --------
     # nhemi_total: hemizygotes in non-PAR (XY only)
-    if hasattr(mt.info, 'AC_joint_XY'):
+    if 'AC_joint_XY' in info_fields:
         annotations['nhemi_joint'] = hl.if_else(
             on_sex_chrom_nonpar,
             get_info_int('AC_joint_XY', 0),
@@ -93,8 +131,8 @@ def main():
     # nhet_total: heterozygotes everywhere
     # Non-PAR: only XX heterozygotes (females)
     # PAR: combined heterozygotes (both sexes)
-    if hasattr(mt.info, 'AC_joint') and hasattr(mt.info, 'nhomalt_joint'):
-        if hasattr(mt.info, 'AC_joint_XX') and hasattr(mt.info, 'nhomalt_joint_XX'):
+    if 'AC_joint' in info_fields and 'nhomalt_joint' in info_fields:
+        if 'AC_joint_XX' in info_fields and 'nhomalt_joint_XX' in info_fields:
             annotations['nhet_joint'] = hl.case()\
                 .when(on_sex_chrom_nonpar, calc_nhet('AC_joint_XX', 'nhomalt_joint_XX'))\
                 .when(in_par, calc_nhet('AC_joint', 'nhomalt_joint'))\
@@ -113,7 +151,7 @@ def main():
         
         # Non-PAR: hemizygotes for XY
         ac_xy = f'AC_{prefix}_XY'
-        if hasattr(mt.info, ac_xy):
+        if ac_xy in info_fields:
             annotations[f'nhemi_{anc}_XY'] = hl.if_else(
                 on_sex_chrom_nonpar,
                 get_info_int(ac_xy, 0),
@@ -123,7 +161,7 @@ def main():
         # Non-PAR: heterozygotes for XX
         ac_xx = f'AC_{prefix}_XX'
         nhomalt_xx = f'nhomalt_{prefix}_XX'
-        if hasattr(mt.info, ac_xx) and hasattr(mt.info, nhomalt_xx):
+        if ac_xx in info_fields and nhomalt_xx in info_fields:
             annotations[f'nhet_{anc}_XX'] = hl.if_else(
                 on_sex_chrom_nonpar,
                 calc_nhet(ac_xx, nhomalt_xx),
@@ -133,7 +171,7 @@ def main():
         # PAR: heterozygotes (combined)
         ac_combined = f'AC_{prefix}'
         nhomalt_combined = f'nhomalt_{prefix}'
-        if hasattr(mt.info, ac_combined) and hasattr(mt.info, nhomalt_combined):
+        if ac_combined in info_fields and nhomalt_combined in info_fields:
             annotations[f'nhet_{anc}'] = hl.if_else(
                 in_par,
                 calc_nhet(ac_combined, nhomalt_combined),
@@ -142,7 +180,7 @@ def main():
         
         # -------- Ancestry totals --------
         # nhemi_total for this ancestry
-        if hasattr(mt.info, ac_xy):
+        if ac_xy in info_fields:
             annotations[f'nhemi_{anc}_joint'] = hl.if_else(
                 on_sex_chrom_nonpar,
                 get_info_int(ac_xy, 0),
@@ -150,8 +188,8 @@ def main():
             )
         
         # nhet_total for this ancestry
-        if hasattr(mt.info, ac_combined) and hasattr(mt.info, nhomalt_combined):
-            if hasattr(mt.info, ac_xx) and hasattr(mt.info, nhomalt_xx):
+        if ac_combined in info_fields and nhomalt_combined in info_fields:
+            if ac_xx in info_fields and nhomalt_xx in info_fields:
                 annotations[f'nhet_{anc}_joint'] = hl.case()\
                     .when(on_sex_chrom_nonpar, calc_nhet(ac_xx, nhomalt_xx))\
                     .when(in_par, calc_nhet(ac_combined, nhomalt_combined))\
@@ -165,15 +203,19 @@ def main():
 
     # ------------------ APPLY ANNOTATIONS ------------------
     if annotations:
-        mt = mt.annotate_rows(info=mt.info.annotate(**annotations))
+        ann_rows = ann_mt.select_rows(**annotations).rows()
+        joined = ann_rows[mt.row_key]
+        mt = mt.annotate_rows(info=mt.info.annotate(**{k: joined[k] for k in annotations}))
         print(f"Successfully added {len(annotations)} annotations")
         print("Fields added:", sorted(annotations.keys()))
     else:
         print("Warning: No annotations were added (no matching fields found).")
 
     # ------------------ WRITE ------------------
+    # separate_header writes one bgz shard per partition in parallel;
+    # cat header + part-*.bgz if a single file is needed downstream
     out_path = f"{vcf_path}.annotated-both-het-hemi.vcf.bgz"
-    hl.export_vcf(mt, out_path)
+    hl.export_vcf(mt, out_path, parallel='separate_header')
     print(f"Wrote: {out_path}")
 
     # ------------------ STOP ------------------
@@ -17,13 +17,13 @@ def main():
     mt = hl.import_vcf(vcf_path, reference_genome='GRCh38')
 
     # ------------------ FILTER VARIANTS ------------------
-    filters_to_remove = ['BOTH_FILTERED', 'EXOMES_FILTERED', 'GENOMES_FILTERED']
+    bad_filters = hl.literal({'BOTH_FILTERED', 'EXOMES_FILTERED', 'GENOMES_FILTERED'})
 
     n_variants_before = mt.count_rows()
     print(f"Variants before filtering: {n_variants_before}")
 
     # Keep rows where none of the unwanted FILTERs are present
-    mt = mt.filter_rows(~hl.any(lambda f: hl.literal(filters_to_remove).contains(f), mt.filters))
+    mt = mt.filter_rows(hl.len(mt.filters.intersection(bad_filters)) == 0)
 
     n_variants_after = mt.count_rows()
     print(f"Variants after filtering:  {n_variants_after}")
@@ -33,6 +33,10 @@ def main():
     # Ancestries present in file
     ancestries = ['afr', 'ami', 'amr', 'asj', 'eas', 'fin', 'mid', 'nfe', 'remaining', 'sas']
 
+    # Snapshot INFO field names once; set lookups replace hasattr probes
+    # that each built a Hail expression object
+    info_fields = set(mt.info.dtype.fields)
+
     # ------------------ HEMIZYGOUS LOGIC ------------------
     # Hemi counts only apply to sex chromosomes outside PAR
     on_sex_chrom_nonpar = ~mt.locus.in_autosome_or_par()
@@ -43,19 +47,20 @@ def main():
     def nhemi_from_ac(field_name):
         """Return an expression: AC_field[0] if defined and non-PAR sex chrom; else 0."""
         return hl.if_else(
-            on_sex_chrom_nonpar & hl.is_defined(mt.info[field_name]),
-            mt.info[field_name][0],  # Index the array here to get int32
+            on_sex_chrom_nonpar,
+            # Index the array to get int32; or_else handles missing AC
+            hl.or_else(mt.info[field_name][0], hl.int32(0)),
             hl.int32(0)
         )
 
     # -------- Overall / Joint --------
     # nhemi_joint (combined sexes): equal to AC_joint_XY (male AC) on non-PAR sex chrom
-    if hasattr(mt.info, 'AC_joint_XY'):
+    if 'AC_joint_XY' in info_fields:
         he_annotations['nhemi_joint'] = nhemi_from_ac('AC_joint_XY')
 
     # Sex-stratified:
     # nhemi_joint_XX = 0 always; nhemi_joint_XY = AC_joint_XY (on non-PAR sex chrom)
-    if hasattr(mt.info, 'AC_joint_XY'):
+    if 'AC_joint_XY' in info_fields:
         he_annotations['nhemi_joint_XY'] = nhemi_from_ac('AC_joint_XY')
         he_annotations['nhemi_joint_XX'] = hl.int32(0)
 
@@ -63,13 +68,13 @@ def main():
     # For each ancestry, if AC_joint_{ancestry}_XY exists, that's the hemizygote count on non-PAR sex chrom
     for anc in ancestries:
         ac_xy_field = f'AC_joint_{anc}_XY'
-        if hasattr(mt.info, ac_xy_field):
+        if ac_xy_field in info_fields:
             he_annotations[f'nhemi_{anc}'] = nhemi_from_ac(ac_xy_field)
 
     # Sex-split hemizygotes within ancestries
     for anc in ancestries:
         ac_xy_field = f'AC_joint_{anc}_XY'
-        if hasattr(mt.info, ac_xy_field):
+        if ac_xy_field in info_fields:
             he_annotations[f'nhemi_{anc}_XY'] = nhemi_from_ac(ac_xy_field)
             he_annotations[f'nhemi_{anc}_XX'] = hl.int32(0)
 
@@ -80,8 +85,10 @@ def main():
         print("Warning: No hemizygote annotations were added (no matching AC_*_XY fields found).")
 
     # ------------------ WRITE ------------------
+    # separate_header writes one bgz shard per partition in parallel;
+    # cat header + part-*.bgz if a single file is needed downstream
     out_path = f"{vcf_path}.nhemi.vcf.bgz"
-    hl.export_vcf(mt, out_path)
+    hl.export_vcf(mt, out_path, parallel='separate_header')
     print(f"Wrote: {out_path}")
 
     print(f"Successfully added {len(he_annotations)} hemizygote count fields")
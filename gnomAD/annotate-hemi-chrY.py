@@ -14,89 +14,91 @@ def main():
 
     # ------------------ READ ------------------
     vcf_path = sys.argv[1]
-    mt = hl.import_vcf(vcf_path, reference_genome='GRCh38')
+    # Sites-only VCF: drop the empty entries axis and work on a row Table
+    ht = hl.import_vcf(vcf_path, reference_genome='GRCh38', drop_samples=True,
+                       force_bgz=True).rows()
+
+    # Restrict to chrY up front: the interval is pushed into the bgz
+    # block index so non-chrY blocks are skipped without being decoded
+    ht = hl.filter_intervals(
+        ht, [hl.parse_locus_interval('chrY', reference_genome='GRCh38')]
+    )
 
     # ------------------ FILTER VARIANTS ------------------
-    filters_to_remove = ['BOTH_FILTERED', 'EXOMES_FILTERED', 'GENOMES_FILTERED']
+    bad_filters = hl.literal({'BOTH_FILTERED', 'EXOMES_FILTERED', 'GENOMES_FILTERED'})
 
-    n_variants_before = mt.count_rows()
-    print(f"Variants before filtering: {n_variants_before}")
+    # Count total and kept rows in one scan instead of a count_rows
+    # pass on each side of the filter
+    keep_expr = hl.len(ht.filters.intersection(bad_filters)) == 0
+    counts = ht.aggregate(hl.struct(
+        total=hl.agg.count(),
+        kept=hl.agg.count_where(keep_expr)
+    ))
+    print(f"Variants before filtering: {counts.total}")
+    print(f"Variants after filtering:  {counts.kept}")
+    print(f"Variants removed:          {counts.total - counts.kept}")
 
     # Keep rows where none of the unwanted FILTERs are present
-    mt = mt.filter_rows(~hl.any(lambda f: hl.literal(filters_to_remove).contains(f), mt.filters))
-
-    n_variants_after = mt.count_rows()
-    print(f"Variants after filtering:  {n_variants_after}")
-    print(f"Variants removed:          {n_variants_before - n_variants_after}")
-
-    # ------------------ IDENTIFY CHRY (AFTER FILTERING) ------------------
-    is_chry = mt.locus.contig == 'chrY'
+    ht = ht.filter(keep_expr)
 
     # ------------------ FIND AC FIELDS ------------------
     # Get all info fields that start with 'AC_joint'
-    ac_fields = [f for f in mt.info if f.startswith('AC_joint')]
+    # Static schema: iterate field names, not the info Expression
+    ac_fields = [f for f in ht.info.dtype.fields if f.startswith('AC_joint')]
     
     print(f"Found {len(ac_fields)} AC_joint fields to process:")
     print(ac_fields)
 
     # ------------------ CREATE NHEMI FIELDS ------------------
-    new_annotations = {}
-    
-    # Process each AC field found
-    for field in ac_fields:
-        # Generate corresponding nhemi field name
-        # AC_joint -> nhemi_joint
-        # AC_joint_afr -> nhemi_joint_afr
-        # AC_joint_afr_XY -> nhemi_joint_afr_XY
-        nhemi_field = field.replace('AC', 'nhemi')
-        
-        # Check if nhemi field already exists
-        nhemi_exists = hasattr(mt.info, nhemi_field)
-        
-        # Get the field value to determine its type
-        field_value = mt.info[field]
-        field_type = field_value.dtype
-        
-        # Create a zero value matching the field type
-        if isinstance(field_type, hl.tarray):
-            # For array types, create array of zeros with same length
-            zero_value = hl.map(lambda x: hl.int32(0), field_value)
-        else:
-            # For scalar types
-            zero_value = hl.int32(0)
-        
-        # If on chrY: nhemi = AC_joint value
-        # If not on chrY: nhemi = existing value or 0
-        if nhemi_exists:
-            new_annotations[nhemi_field] = hl.if_else(
-                is_chry,
-                field_value,  # Copy AC_joint value to nhemi for chrY
-                mt.info[nhemi_field]  # Keep existing nhemi value
-            )
-        else:
-            new_annotations[nhemi_field] = hl.if_else(
-                is_chry,
-                field_value,  # Copy AC_joint value to nhemi for chrY
-                zero_value  # Set to 0 (matching type) for non-chrY
-            )
+    # Map each AC field to its nhemi name:
+    # AC_joint -> nhemi_joint
+    # AC_joint_afr -> nhemi_joint_afr
+    # AC_joint_afr_XY -> nhemi_joint_afr_XY
+    # Every remaining row is chrY, so nhemi is unconditionally the
+    # AC_joint value; the whole batch is built in one comprehension and
+    # applied in one annotate below
+    new_annotations = {f.replace('AC', 'nhemi'): ht.info[f] for f in ac_fields}
 
     # ------------------ APPLY ANNOTATIONS ------------------
     if new_annotations:
-        mt = mt.annotate_rows(info=mt.info.annotate(**new_annotations))
+        ht = ht.annotate(info=ht.info.annotate(**new_annotations))
         print(f"Successfully processed {len(ac_fields)} AC_joint fields")
-        print(f"- For chrY: nhemi_joint_* = AC_joint_* values")
-        print(f"- For non-chrY: nhemi_joint_* preserved or set to 0")
-        nhemi_fields = sorted(set([k for k in new_annotations.keys()]))
+        print(f"- nhemi_joint_* = AC_joint_* values (all rows are chrY)")
+        nhemi_fields = sorted(new_annotations.keys())
         print(f"Created/updated {len(nhemi_fields)} nhemi_joint fields:")
         print(nhemi_fields)
     else:
         print("Warning: No AC_joint fields found to process.")
 
     # ------------------ WRITE ------------------
+    # Persist the annotated table in Hail native format first: the VCF
+    # export streams from it instead of re-running the annotation DAG,
+    # and downstream Hail consumers can read the .ht directly
+    ht = ht.checkpoint(f"{vcf_path}.chry_nhemi.ht", overwrite=True)
+
+    # separate_header shards the write across partitions instead of
+    # funnelling everything through one bgzip writer on the driver
+    # (cat header + part-*.bgz for a single file)
     out_path = f"{vcf_path}.chry_nhemi.vcf.bgz"
-    hl.export_vcf(mt, out_path)
+    hl.export_vcf(ht, out_path, parallel='separate_header')
     print(f"Wrote: {out_path}")
 
+    # ------------------ EXPORT HEMI TSV ------------------
+    # Small side table of the variants with a non-zero hemizygous count,
+    # so extract_hemi_not_0.py can display them with pandas alone
+    # instead of paying JVM/Spark startup for a seconds-long report
+    if 'nhemi_joint' in ht.info.dtype.fields:
+        hemi = ht.filter(ht.info.nhemi_joint != 0)
+        info_fields = set(ht.info.dtype.fields)
+        hemi = hemi.select(
+            nhemi_joint=hemi.info.nhemi_joint,
+            AC_joint_XY=hemi.info.AC_joint_XY[0] if 'AC_joint_XY' in info_fields else hl.missing('int32'),
+            AN_joint_XY=hemi.info.AN_joint_XY if 'AN_joint_XY' in info_fields else hl.missing('int32')
+        )
+        tsv_path = f"{vcf_path}.chry_nhemi.hemi.tsv.gz"
+        hemi.export(tsv_path)
+        print(f"Wrote: {tsv_path}")
+
     # ------------------ STOP ------------------
     hl.stop()
 
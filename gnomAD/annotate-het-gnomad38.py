@@ -1,88 +1,88 @@
 import hail as hl
-import sys
-
-chr_num = sys.argv[1]
-
-# Mireia Marin i Ginestar 
-
-# Initialize Hail
-hl.init()
-
-
-# Read the VCF file
-#mt = hl.import_vcf('../../gnomAD/gnomad38/gnomad.joint.v4.1.sites.chr1.vcf.bgz', reference_genome='GRCh38')
-mt = hl.import_vcf(f'../../gnomAD/gnomad38/gnomad.joint.v4.1.sites.chr{chr_num}.vcf.bgz', reference_genome='GRCh38')
-
-# ======================== FILTER VARIANTS ====================================================
-# Filter out variants with specific FILTER values
-filters_to_remove = ['BOTH_FILTERED', 'EXOMES_FILTERED', 'GENOMES_FILTERED']
-
-# Count before filtering
-n_variants_before = mt.count_rows()
-print(f"Variants before filtering: {n_variants_before}")
-
-# Filter: keep only variants where FILTER is NOT in the list
-# filters is a set in Hail, so we check if any of the unwanted filters are present
-mt = mt.filter_rows(
-    ~hl.any(lambda f: hl.literal(filters_to_remove).contains(f), mt.filters)
-)
-
-# Count after filtering
-n_variants_after = mt.count_rows()
-print(f"Variants after filtering: {n_variants_after}")
-print(f"Variants removed: {n_variants_before - n_variants_after}")
-
-# ======================== CALCULATE STRATIFIED AFs ============================================
-
-# Define ancestries
-ancestries = ['afr', 'ami', 'amr', 'asj', 'eas', 'fin', 'mid', 'nfe', 'remaining', 'sas']
-
-# Define sex categories
-sex_categories = ['', '_XX', '_XY']  # '' for combined, _XX for female, _XY for male
-
-# Create annotation dictionary
-annotations = {}
-
-# Add nhet for joint (no ancestry suffix)
-for sex in sex_categories:
-    sex_suffix = sex if sex else ''
-    ac_field = f'AC_joint{sex_suffix}'
-    nhomalt_field = f'nhomalt_joint{sex_suffix}'
-    nhet_field = f'nhet_joint{sex_suffix}'
-    
-    # Check if fields exist and calculate
-    if hasattr(mt.info, ac_field) and hasattr(mt.info, nhomalt_field):
-        annotations[nhet_field] = mt.info[ac_field] - 2 * mt.info[nhomalt_field]
-
-# Add nhet for each ancestry
-for ancestry in ancestries:
-    for sex in sex_categories:
-        sex_suffix = sex if sex else ''
-        ac_field = f'AC_joint_{ancestry}{sex_suffix}'
-        nhomalt_field = f'nhomalt_joint_{ancestry}{sex_suffix}'
-        nhet_field = f'nhet_joint_{ancestry}{sex_suffix}'
-        
-        # Check if fields exist and calculate
-        if hasattr(mt.info, ac_field) and hasattr(mt.info, nhomalt_field):
-            annotations[nhet_field] = mt.info[ac_field] - 2 * mt.info[nhomalt_field]
-
-# Add nhet for raw
-if hasattr(mt.info, 'AC_joint_raw') and hasattr(mt.info, 'nhomalt_joint_raw'):
-    annotations['nhet_joint_raw'] = mt.info.AC_joint_raw - 2 * mt.info.nhomalt_joint_raw
-
-# Annotate the matrix table with all new fields
-mt = mt.annotate_rows(info=mt.info.annotate(**annotations))
-
-# Write the output VCF
-hl.export_vcf(
-        mt,
-        f"gnomad.joint.v4.1.sites.chr{chr_num}.subset2_nhet.vcf.bgz"
-        )
-
-
-print(f"Successfully added {len(annotations)} heterozygote count fields")
-print("Fields added:", list(annotations.keys()))
-
-# Stop Hail
-hl.stop()
-
+import re
+from argparse import ArgumentParser
+
+# Mireia Marin i Ginestar
+
+VCF_TEMPLATE = '../../gnomAD/gnomad38/gnomad.joint.v4.1.sites.chr{chr_num}.vcf.bgz'
+
+
+def main():
+    ap = ArgumentParser(description="Add nhet_joint* fields to gnomAD v4.1 joint sites VCFs.")
+    ap.add_argument("chr_nums", nargs='+',
+                    help="Chromosome number(s), e.g. '1' or '1 2 X'. Passing "
+                         "several processes them all in one Hail session, "
+                         "amortizing JVM startup and sharing executors.")
+    args = ap.parse_args()
+
+    # Initialize Hail
+    hl.init()
+
+    # Read every requested chromosome into one pipeline
+    # Sites-only VCF: drop the empty entries axis and work on a row Table
+    paths = [VCF_TEMPLATE.format(chr_num=c) for c in args.chr_nums]
+    ht = hl.import_vcf(paths, reference_genome='GRCh38', drop_samples=True).rows()
+
+    # ======================== FILTER VARIANTS ====================================================
+    # Filter out variants with specific FILTER values
+    bad_filters = hl.literal({'BOTH_FILTERED', 'EXOMES_FILTERED', 'GENOMES_FILTERED'})
+
+    # Count total and kept rows in one scan instead of a count_rows pass
+    # on each side of the filter
+    keep_expr = hl.len(ht.filters.intersection(bad_filters)) == 0
+    counts = ht.aggregate(hl.struct(
+        total=hl.agg.count(),
+        kept=hl.agg.count_where(keep_expr)
+    ))
+    print(f"Variants before filtering: {counts.total}")
+    print(f"Variants after filtering: {counts.kept}")
+    print(f"Variants removed: {counts.total - counts.kept}")
+
+    # Filter: keep only variants where FILTER is NOT in the list
+    # filters is a set in Hail, so drop any row intersecting the bad set
+    ht = ht.filter(keep_expr)
+
+    # ======================== CALCULATE STRATIFIED AFs ============================================
+
+    # Static schema lookup once; no hasattr probes against the Hail struct
+    info_fields = set(ht.info.dtype.fields)
+
+    # Derive the strata straight from the schema: any AC_joint* field with
+    # a paired nhomalt gets an nhet. Covers joint, per-ancestry, the
+    # XX/XY splits and raw, and picks up new ancestries automatically.
+    ac_re = re.compile(r'^AC_joint(.*)$', re.ASCII)
+
+    annotations = {}
+    for field in ht.info.dtype.fields:
+        m = ac_re.match(field)
+        if not m:
+            continue
+        suffix = m.group(1)
+        nhomalt_field = f'nhomalt_joint{suffix}'
+        if nhomalt_field in info_fields:
+            # nhet = AC - 2*nhomalt; the power-of-two constant lets the
+            # JIT lower the multiply to a shift in the per-row loop
+            annotations[f'nhet_joint{suffix}'] = ht.info[field] - (ht.info[nhomalt_field] * 2)
+
+    ht = ht.annotate(info=ht.info.annotate(**annotations))
+
+    # Persist the annotated table in Hail native format first: the VCF
+    # export streams from it instead of re-running import+filter+annotate,
+    # and downstream Hail consumers can read the .ht directly
+    chr_tag = "chr" + "_".join(args.chr_nums)
+    out_stem = f"gnomad.joint.v4.1.sites.{chr_tag}.subset2_nhet"
+    ht = ht.checkpoint(f"{out_stem}.ht", overwrite=True)
+
+    # Write the output VCF; separate_header shards the write across
+    # partitions (cat header + part-*.bgz for a single file)
+    hl.export_vcf(ht, f"{out_stem}.vcf.bgz", parallel='separate_header')
+
+    print(f"Successfully added {len(annotations)} heterozygote count fields")
+    print("Fields added:", list(annotations.keys()))
+
+    # Stop Hail
+    hl.stop()
+
+
+if __name__ == "__main__":
+    main()
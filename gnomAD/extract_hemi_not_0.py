@@ -2,91 +2,62 @@
 # Purpose: Print variants where nhemi_joint is not 0
 # Mireia Marin i Ginestar
 
-import hail as hl
 import sys
 
+import pandas as pd
+
 def main():
     if len(sys.argv) != 2:
-        print("Usage: python print_hemizygous_variants.py <vcf_file_path>")
+        print("Usage: python print_hemizygous_variants.py <hemi_tsv>")
+        print("  <hemi_tsv> is the .hemi.tsv.gz side table exported by")
+        print("  annotate-hemi-chrY.py (one row per variant with")
+        print("  nhemi_joint != 0).")
         sys.exit(1)
 
-    # ------------------ INIT ------------------
-    hl.init(log="/tmp/hail_print_hemizygous.log")
-
     # ------------------ READ ------------------
-    vcf_path = sys.argv[1]
-    print(f"Reading VCF: {vcf_path}")
-    mt = hl.import_vcf(vcf_path, reference_genome='GRCh38')
-
-    # ------------------ FILTER FOR HEMIZYGOUS VARIANTS ------------------
-    # Check if nhemi_joint exists
-    if 'nhemi_joint' not in mt.info:
-        print("Error: 'nhemi_joint' field not found in INFO. Please run add_hemizygotes.py first.")
+    # The annotate script already filtered to nhemi_joint != 0 and kept
+    # only the displayed columns, so this is a plain pandas read: no
+    # Hail import, no JVM/Spark warmup for a display-only report
+    tsv_path = sys.argv[1]
+    print(f"Reading: {tsv_path}")
+    df = pd.read_csv(tsv_path, sep='\t')
+
+    if 'nhemi_joint' not in df.columns:
+        print("Error: 'nhemi_joint' column not found. Expected the "
+              ".hemi.tsv.gz exported by annotate-hemi-chrY.py.")
         sys.exit(1)
 
-    # Filter for variants where nhemi_joint is not 0
-    mt_hemi = mt.filter_rows(
-        hl.is_defined(mt.info.nhemi_joint) & (mt.info.nhemi_joint != 0)
-    )
-
-    # Count how many variants have hemizygous calls
-    n_hemi_variants = mt_hemi.count_rows()
+    n_hemi_variants = len(df)
     print(f"\nTotal variants with nhemi_joint != 0: {n_hemi_variants}")
 
     if n_hemi_variants == 0:
         print("No variants found with non-zero nhemi_joint.")
-        hl.stop()
         return
 
-    # ------------------ COLLECT AND PRINT 10 VARIANTS ------------------
-    # Take first 10 variants
-    n_to_show = min(10, n_hemi_variants)
-    print(f"\nShowing first {n_to_show} variants:\n")
-
-    # Select relevant fields for display
-    rows = mt_hemi.rows()
-    rows = rows.select(
-        'locus',
-        'alleles',
-        nhemi_joint=rows.info.nhemi_joint,
-        AC_joint_XY=rows.info.AC_joint_XY[0] if 'AC_joint_XY' in rows.info else hl.missing('int32'),
-        AN_joint_XY=rows.info.AN_joint_XY if 'AN_joint_XY' in rows.info else hl.missing('int32')
-    )
+    # ------------------ PRINT 10 VARIANTS ------------------
+    sample = df.head(10).copy()
+    print(f"\nShowing first {len(sample)} variants:\n")
 
-    # Collect first 10 rows
-    sample_rows = rows.take(n_to_show)
-
-    # Print header
-    print(f"{'Locus':<20} {'Ref':<10} {'Alt':<10} {'nhemi_joint':<12} {'AC_XY':<10} {'AN_XY':<10}")
-    print("-" * 80)
-
-    # Print each variant
-    for row in sample_rows:
-        locus = f"{row.locus.contig}:{row.locus.position}"
-        ref = row.alleles[0]
-        alt = row.alleles[1] if len(row.alleles) > 1 else "."
-        nhemi = row.nhemi_joint
-        ac_xy = row.AC_joint_XY if hl.is_defined(row.AC_joint_XY) else "NA"
-        an_xy = row.AN_joint_XY if hl.is_defined(row.AN_joint_XY) else "NA"
-        
-        print(f"{locus:<20} {ref:<10} {alt:<10} {nhemi:<12} {ac_xy:<10} {an_xy:<10}")
+    # locus/alleles come from Hail's export: locus as contig:pos,
+    # alleles as a JSON-style ["ref","alt"] list
+    sample['ref'] = sample['alleles'].str.extract(r'"([^"]+)"')
+    sample['alt'] = sample['alleles'].str.extract(r'"[^"]+","([^"]+)"').fillna(".")
+    cols = ['locus', 'ref', 'alt', 'nhemi_joint', 'AC_joint_XY', 'AN_joint_XY']
+    out = sample[cols].rename(columns={'AC_joint_XY': 'AC_XY', 'AN_joint_XY': 'AN_XY'})
+    print(out.fillna("NA").to_string(index=False))
 
     # ------------------ ADDITIONAL STATS ------------------
     print("\n" + "="*80)
     print("SUMMARY STATISTICS")
     print("="*80)
-    
-    # Calculate some statistics
-    stats = rows.aggregate(hl.agg.stats(rows.nhemi_joint))
-    print(f"\nnhemi_joint statistics:")
-    print(f"  Mean:   {stats.mean:.2f}")
-    print(f"  Median: {stats.median:.2f}" if hasattr(stats, 'median') else "  Median: N/A")
-    print(f"  Min:    {stats.min}")
-    print(f"  Max:    {stats.max}")
-    print(f"  StdDev: {stats.stdev:.2f}")
 
-    # ------------------ STOP ------------------
-    hl.stop()
+    nhemi = df['nhemi_joint']
+    print(f"\nnhemi_joint statistics:")
+    print(f"  Mean:   {nhemi.mean():.2f}")
+    print(f"  Median: {nhemi.median():.2f}")
+    print(f"  Min:    {nhemi.min()}")
+    print(f"  Max:    {nhemi.max()}")
+    print(f"  StdDev: {nhemi.std():.2f}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()